@@ -0,0 +1,305 @@
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from utils.mapping_utils import get_valid_sku_matches
+from utils.date_utils import standardize_date_column
+from utils.colors import RED_FILL, BLUE_FILL, YELLOW_FILL, GREEN_FILL, PINK_FILL
+from utils.excel_utils import paint_rows, stripped_usecols, CSSM_COMPARE_COLUMNS, READ_ENGINE
+
+# PRE-EA files with at least this many rows are classified across worker processes
+PARALLEL_MIN_ROWS = 20000
+# PRE-EA rows classified per block by the first-match comparison
+CLASSIFY_BLOCK_ROWS = 100_000
+
+FLAG_FILLS = {
+    'PURPLE': PINK_FILL,
+    'RED': RED_FILL,
+    'BLUE': BLUE_FILL,
+    'YELLOW': YELLOW_FILL,
+    'GREEN': GREEN_FILL,
+}
+
+# Flag names as written in the "Marking as ..." log lines; the Streamlit log table matches these
+FLAG_LABELS = {
+    'PURPLE': '🟪 PURPLE',
+    'RED': '🟥 RED',
+    'BLUE': '🟦 BLUE',
+    'YELLOW': '🟨 YELLOW',
+    'GREEN': '🟩 GREEN',
+}
+
+# CSSM index and SKU map shared with worker processes through the pool initializer
+_worker_cssm_by_source = None
+_worker_pid_to_skus_map = None
+
+
+def load_cssm(source) -> pd.DataFrame:
+    """Load the CSSM 'License Detail' sheet (header on row 6) ready for comparison.
+
+    - Keeps only the compared columns and strips whitespace from their names.
+    - Strips 'Source Identifier' and 'SKU' to strings.
+    - Converts 'Available To Use' to nullable ints (non-numeric -> <NA>), truncating like int().
+    - Adds '_sub_end' with the parsed 'Subscription End Date' (date or None).
+    """
+    cssm = pd.read_excel(source, sheet_name='License Detail', header=5, engine=READ_ENGINE,
+                         usecols=stripped_usecols(CSSM_COMPARE_COLUMNS))
+    cssm.columns = cssm.columns.map(str.strip)
+    cssm['Source Identifier'] = cssm['Source Identifier'].astype(str).str.strip()
+    cssm['SKU'] = cssm['SKU'].astype(str).str.strip()
+    cssm['Available To Use'] = np.trunc(pd.to_numeric(cssm['Available To Use'], errors='coerce')).astype('Int64')
+    cssm['_sub_end'] = standardize_date_column(cssm['Subscription End Date'])
+    return cssm
+
+
+def load_pre_ea(source) -> pd.DataFrame:
+    """Load the PRE-EA sheet, stripping column names and the two key columns."""
+    pre_ea = pd.read_excel(source, engine=READ_ENGINE)
+    pre_ea.columns = pre_ea.columns.map(str.strip)
+    pre_ea['ALC Order Number'] = pre_ea['ALC Order Number'].astype(str).str.strip()
+    pre_ea['Pre EA Migrated Pid'] = pre_ea['Pre EA Migrated Pid'].astype(str).str.strip()
+    return pre_ea
+
+
+def classify(pre_ea: pd.DataFrame, cssm: pd.DataFrame, pid_to_skus_map: dict[str, list[str]],
+             today=None, enable_pink: bool = False, consume_matches: bool = False, max_workers=1) -> list[tuple]:
+    """Classify every PRE-EA row against CSSM without touching the workbook.
+
+    Expects frames from `load_pre_ea` / `load_cssm`. The cascade is: expired (PURPLE, only
+    with `enable_pink`) -> ALC Order Number or SKU missing (RED) -> quantity (BLUE) ->
+    expiration dates (YELLOW / GREEN).
+
+    - Without `consume_matches`, each row is compared with the first CSSM row for its
+      (Source Identifier, SKU) pair in one vectorized pass.
+    - With `consume_matches`, each row takes the first *unused* CSSM candidate with an
+      equal quantity, so rows are walked in order; `max_workers` > 1 (or None for
+      automatic above PARALLEL_MIN_ROWS) splits that walk across processes.
+
+    Returns (excel_row_idx, flag, log_level, message, args) tuples in sheet order.
+    """
+    today = today or datetime.today().date()
+    pre_ea_exp_date = standardize_date_column(pre_ea['Expiration Date'], in_format="%m/%d/%Y")
+    if not consume_matches:
+        return _classify_first_match(pre_ea, pre_ea_exp_date, cssm, pid_to_skus_map, today, enable_pink)
+
+    # Pull the needed columns as plain lists; avoids building a Series per row
+    rows = list(zip(
+        range(2, len(pre_ea) + 2),  # Excel row index (header + 0-index)
+        pre_ea['ALC Order Number'].tolist(),
+        pre_ea['Pre EA Migrated Pid'].tolist(),
+        pre_ea['Quantity'].tolist(),
+        pre_ea['Expiration Date'].tolist(),
+        pre_ea_exp_date.tolist(),
+    ))
+    cssm_by_source = {key: group for key, group in cssm.groupby('Source Identifier', sort=False)}
+
+    if max_workers is None:
+        max_workers = (os.cpu_count() or 1) if len(rows) >= PARALLEL_MIN_ROWS else 1
+    if max_workers <= 1:
+        return _classify_consuming(rows, cssm_by_source, pid_to_skus_map, today, enable_pink)
+
+    # Partition by ALC Order Number so CSSM rows are only ever consumed within one worker
+    partitions = [[] for _ in range(max_workers)]
+    for row in rows:
+        partitions[hash(row[1]) % max_workers].append(row)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_classify_worker,
+                             initargs=(cssm_by_source, pid_to_skus_map)) as executor:
+        results = [result
+                   for chunk in executor.map(_classify_in_worker, partitions,
+                                             [today] * max_workers, [enable_pink] * max_workers)
+                   for result in chunk]
+    results.sort(key=lambda result: result[0])
+    return results
+
+
+def apply_results(ws, results, ncols: int, logger, labels=FLAG_LABELS) -> dict[str, int]:
+    """Log each classified row in sheet order, then paint rows one colour at a time.
+
+    ``labels`` maps each flag to the text after "Marking as"; pass ``None`` for the bare flag name.
+    Returns the number of rows per flag.
+    """
+    rows_by_flag = {flag: [] for flag in FLAG_FILLS}
+    for excel_row_idx, flag, level, message, args in results:
+        logger.log(level, message, *args, labels[flag] if labels else flag)
+        rows_by_flag[flag].append(excel_row_idx)
+    for flag, excel_rows in rows_by_flag.items():
+        paint_rows(ws, excel_rows, ncols, FLAG_FILLS[flag])
+    return {flag: len(excel_rows) for flag, excel_rows in rows_by_flag.items()}
+
+
+def _expired_record(excel_row_idx, pre_ea_exp_date):
+    return (excel_row_idx, 'PURPLE', logging.INFO, "Row %d: PRE-EA Expiration Date '%s' is earlier than today. Marking as %s.", (excel_row_idx, pre_ea_exp_date))
+
+
+def _missing_order_record(excel_row_idx, alc_order_number_str):
+    return (excel_row_idx, 'RED', logging.INFO, "Row %d: ALC Order Number '%s' NOT found in CSSM. Marking as %s.", (excel_row_idx, alc_order_number_str))
+
+
+def _missing_sku_record(excel_row_idx, pre_ea_migrated_pid_str, alc_order_number_str):
+    return (excel_row_idx, 'RED', logging.INFO, "Row %d: No SKU '%s' (or mapped exception) for ALC Order Number '%s' in CSSM. Marking as %s.", (excel_row_idx, pre_ea_migrated_pid_str, alc_order_number_str))
+
+
+def _date_records(excel_row_idx, pre_ea_exp, pre_ea_exp_date, cssm_end, cssm_exp_date):
+    if pre_ea_exp_date is None or cssm_exp_date is None:
+        return (excel_row_idx, 'YELLOW', logging.WARNING, "Row %d: Invalid date(s). PRE-EA: '%s', CSSM: '%s'. Marking as %s.", (excel_row_idx, pre_ea_exp, cssm_end))
+    if pre_ea_exp_date <= cssm_exp_date:
+        return (excel_row_idx, 'GREEN', logging.INFO, "Row %d: Expiration date OK (PRE-EA: %s, CSSM: %s). Marking as %s.", (excel_row_idx, pre_ea_exp_date, cssm_exp_date))
+    return (excel_row_idx, 'YELLOW', logging.INFO, "Row %d: PRE-EA expiration %s is after CSSM %s.  Marking as %s.", (excel_row_idx, pre_ea_exp_date, cssm_exp_date))
+
+
+def _classify_first_match(pre_ea, pre_ea_exp_date, cssm, pid_to_skus_map, today, enable_pink):
+    lookup = cssm[['Source Identifier', 'SKU']].assign(pos=np.arange(len(cssm)))
+    lookup = lookup.dropna(subset=['Source Identifier', 'SKU'])
+
+    # First CSSM row per (Source Identifier, SKU) pair for direct matches
+    direct = lookup.drop_duplicates(['Source Identifier', 'SKU'])
+
+    # First CSSM row per (Source Identifier, mapped PID) among the exception SKUs
+    map_pairs = pd.DataFrame(
+        [(map_pid, sku) for map_pid, skus in pid_to_skus_map.items() for sku in skus],
+        columns=['map_pid', 'SKU'],
+    )
+    mapped = (lookup.merge(map_pairs, on='SKU')
+              .groupby(['Source Identifier', 'map_pid'], as_index=False)['pos'].min())
+    sources = pd.Index(lookup['Source Identifier'].unique())
+
+    # The lookup tables are shared; the PRE-EA rows go through in fixed-size blocks so the
+    # merge outputs and per-row arrays stay bounded on very large files
+    results = []
+    for start in range(0, len(pre_ea), CLASSIFY_BLOCK_ROWS):
+        stop = start + CLASSIFY_BLOCK_ROWS
+        results.extend(_classify_first_match_block(
+            pre_ea.iloc[start:stop], pre_ea_exp_date[start:stop], cssm, direct, mapped, sources,
+            today, enable_pink, first_excel_row=start + 2))
+    return results
+
+
+def _classify_first_match_block(pre_ea, pre_ea_exp_date, cssm, direct, mapped, sources,
+                                today, enable_pink, first_excel_row):
+    alc = pre_ea['ALC Order Number']
+    pid = pre_ea['Pre EA Migrated Pid']
+    keys = pd.DataFrame({'alc': alc.to_numpy(), 'pid': pid.to_numpy()})
+
+    # Both lookups hold one row per key, so each merge keeps the PRE-EA rows one-to-one
+    # (validate guards the positional alignment the steps below rely on)
+    direct_pos = keys.merge(direct, how='left', left_on=['alc', 'pid'],
+                            right_on=['Source Identifier', 'SKU'], validate='many_to_one')['pos']
+    mapped_pos = keys.merge(mapped, how='left', left_on=['alc', 'pid'],
+                            right_on=['Source Identifier', 'map_pid'], validate='many_to_one')['pos']
+
+    pos = direct_pos.fillna(mapped_pos).to_numpy()
+    has_source = alc.isin(sources).to_numpy()
+    has_sku = ~np.isnan(pos)
+    take = np.where(has_sku, pos, 0).astype(np.int64)
+
+    cssm_qty = cssm['Available To Use'].to_numpy(dtype=float, na_value=np.nan)
+    cssm_qty = np.where(has_sku, cssm_qty[take] if len(cssm) else np.nan, np.nan)
+    qty_ok = cssm_qty == pre_ea['Quantity'].to_numpy()
+
+    cssm_end = cssm['Subscription End Date'].to_numpy(dtype=object)
+    cssm_end = np.where(has_sku, cssm_end[take] if len(cssm) else None, None)
+    cssm_exp_date = cssm['_sub_end'].to_numpy(dtype=object)
+    cssm_exp_date = np.where(has_sku, cssm_exp_date[take] if len(cssm) else None, None)
+    dates_ok = pd.notna(pre_ea_exp_date) & pd.notna(cssm_exp_date)
+
+    expired = np.zeros(len(pre_ea), dtype=bool)
+    if enable_pink:
+        has_exp = pd.notna(pre_ea_exp_date)
+        expired[has_exp] = pre_ea_exp_date[has_exp] < today
+
+    status = np.select(
+        [expired, ~has_source | ~has_sku, ~qty_ok],
+        ['PURPLE', 'RED', 'BLUE'],
+        default='DATES',
+    )
+
+    results = []
+    result_rows = zip(
+        status.tolist(),
+        alc.tolist(),
+        pid.tolist(),
+        has_source.tolist(),
+        pre_ea['Quantity'].tolist(),
+        cssm_qty.tolist(),
+        pre_ea['Expiration Date'].tolist(),
+        cssm_end.tolist(),
+        pre_ea_exp_date.tolist(),
+        cssm_exp_date.tolist(),
+    )
+    for excel_row_idx, (flag, alc_order_number_str, pre_ea_migrated_pid_str, order_found, pre_ea_qty, qty,
+                        pre_ea_exp, end, exp_date, sub_end) in enumerate(result_rows, start=first_excel_row):
+        if flag == 'PURPLE':
+            results.append(_expired_record(excel_row_idx, exp_date))
+        elif flag == 'RED' and not order_found:
+            results.append(_missing_order_record(excel_row_idx, alc_order_number_str))
+        elif flag == 'RED':
+            results.append(_missing_sku_record(excel_row_idx, pre_ea_migrated_pid_str, alc_order_number_str))
+        elif flag == 'BLUE':
+            results.append((excel_row_idx, 'BLUE', logging.INFO, "Row %d: Quantity mismatch (PRE-EA: %s, CSSM: %s). Marking as %s.", (excel_row_idx, pre_ea_qty, None if np.isnan(qty) else int(qty))))
+        else:
+            results.append(_date_records(excel_row_idx, pre_ea_exp, exp_date, end, sub_end))
+    return results
+
+
+def _init_classify_worker(cssm_by_source, pid_to_skus_map):
+    global _worker_cssm_by_source, _worker_pid_to_skus_map
+    _worker_cssm_by_source = cssm_by_source
+    _worker_pid_to_skus_map = pid_to_skus_map
+
+
+def _classify_in_worker(rows, today, enable_pink):
+    return _classify_consuming(rows, _worker_cssm_by_source, _worker_pid_to_skus_map, today, enable_pink)
+
+
+def _classify_consuming(rows, cssm_by_source, pid_to_skus_map, today, enable_pink):
+    """Walk rows in order, letting each one consume the first unused CSSM candidate with its quantity.
+
+    `rows` holds (excel_row_idx, alc_order_number_str, pre_ea_migrated_pid_str, pre_ea_qty,
+    pre_ea_exp, pre_ea_exp_date) tuples; all rows sharing an ALC Order Number must be
+    classified in the same call.
+    """
+    results = []
+    # Tracks used CSSM rows (by index label; CSSM keeps its default RangeIndex) to prevent re-matching
+    cssm_size = max((group.index[-1] for group in cssm_by_source.values()), default=-1) + 1
+    used_mask = np.zeros(cssm_size, dtype=bool)
+    sku_match_cache = {}  # (ALC Order Number, PID) -> candidate CSSM rows; repeated order lines reuse it
+
+    for excel_row_idx, alc_order_number_str, pre_ea_migrated_pid_str, pre_ea_qty, pre_ea_exp, pre_ea_exp_date in rows:
+        if enable_pink and pre_ea_exp_date and pre_ea_exp_date < today:
+            results.append(_expired_record(excel_row_idx, pre_ea_exp_date))
+            continue
+        cssm_matches = cssm_by_source.get(alc_order_number_str)
+        if cssm_matches is None:
+            results.append(_missing_order_record(excel_row_idx, alc_order_number_str))
+            continue
+        cache_key = (alc_order_number_str, pre_ea_migrated_pid_str)
+        cached = sku_match_cache.get(cache_key)
+        if cached is None:
+            sku_match = get_valid_sku_matches(cssm_matches, pre_ea_migrated_pid_str, pid_to_skus_map)
+            # Plain arrays so the chosen candidate is read positionally, without building a row Series
+            cached = (sku_match.index.to_numpy(),
+                      sku_match['Available To Use'].to_numpy(dtype=float, na_value=np.nan),
+                      sku_match['Subscription End Date'].to_numpy(dtype=object),
+                      sku_match['_sub_end'].to_numpy(dtype=object))
+            sku_match_cache[cache_key] = cached
+        candidate_idx, candidate_qty, candidate_end, candidate_sub_end = cached
+
+        if not len(candidate_idx):
+            results.append(_missing_sku_record(excel_row_idx, pre_ea_migrated_pid_str, alc_order_number_str))
+            continue
+
+        # First unused candidate whose quantity matches (missing quantities are NaN and never match)
+        eligible = (candidate_qty == pre_ea_qty) & ~used_mask[candidate_idx]
+        if not eligible.any():
+            results.append((excel_row_idx, 'BLUE', logging.INFO, "Row %d: Quantity mismatch (PRE-EA: %s, CSSM: No available matching quantity). Marking as %s.", (excel_row_idx, pre_ea_qty)))
+            continue
+        first = int(eligible.argmax())
+        # Mark this CSSM row as used so it can't be matched again
+        used_mask[candidate_idx[first]] = True
+
+        results.append(_date_records(excel_row_idx, pre_ea_exp, pre_ea_exp_date,
+                                     candidate_end[first], candidate_sub_end[first]))
+
+    return results
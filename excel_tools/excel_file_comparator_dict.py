@@ -1,39 +1,89 @@
 import os
 import sys
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import pandas as pd
 import numpy as np
-from openpyxl import load_workbook
 from openpyxl.styles import PatternFill
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles.cell_style import StyleArray
 # Add parent directory to path for relative imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.fs_utils import ensure_clean_dir
-from utils.logging_utils import setup_logging
+from utils.logging_utils import setup_logging, flush_logging
 from utils.mapping_utils import load_pid_to_skus_map, get_valid_sku_matches
-from utils.date_utils import standardize_date
+from utils.date_utils import standardize_date_column
+from utils.excel_utils import stripped_usecols, READ_ENGINE
 from utils.colors import RED_FILL, BLUE_FILL, YELLOW_FILL, GREEN_FILL, PINK_FILL
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="openpyxl")
 
+# Fixed categories so flag/usage assignments never have to grow the categorical
+FLAG_DTYPE = pd.CategoricalDtype(['', 'PURPLE', 'RED', 'GREEN', 'YELLOW', 'BLUE', 'GREY'])
+USED_DTYPE = pd.CategoricalDtype(['', 'YES', 'Yes'])
+# CSSM 'License Detail' columns compute_licensing_files reads (the PRE-EA sheet is written back whole)
+CSSM_COLUMNS = ('Source Identifier', 'SKU', 'Available To Use', 'Virtual Account')
+
+# Report row fill per flag, built once and shared by every export (rows without a flag stay unfilled)
+REPORT_FILLS = {
+    'GREEN': PatternFill(start_color='C6EFCE', end_color='C6EFCE', fill_type='solid'),  # light green
+    'RED': PatternFill(start_color='FFC7CE', end_color='FFC7CE', fill_type='solid'),    # light red
+    'PURPLE': PatternFill(start_color='D9D2E9', end_color='D9D2E9', fill_type='solid'), # light purple
+    'YELLOW': PatternFill(start_color='FFEB9C', end_color='FFEB9C', fill_type='solid'), # light yellow
+    'BLUE': PatternFill(start_color='BDD7EE', end_color='BDD7EE', fill_type='solid'),   # light blue
+    'GREY': PatternFill(start_color='D9D9D9', end_color='D9D9D9', fill_type='solid'),   # light grey
+}
+
 class ExcelFileComparator:
     def __init__(self, output_dir=None, log_filename="compare_excels.log"):
         self.output_dir = output_dir or os.path.join(os.getcwd(), "output_files")
         ensure_clean_dir(self.output_dir)
         self.logger = setup_logging(log_dir=self.output_dir, log_filename=log_filename)
 
-    def _load_df(self, file_path, sheet_name=None, header=0):
-        """Helper method to load a DataFrame from an Excel file."""
+    def _load_df(self, file_path, sheet_name=None, header=0, usecols=None):
+        """Helper method to load a DataFrame from an Excel file.
+
+        `usecols` lists the (whitespace-stripped) column names to keep; all columns by default.
+        """
         try:
-            df = pd.read_excel(file_path, sheet_name=sheet_name, header=header)
+            if usecols is not None:
+                usecols = stripped_usecols(usecols)
+            df = pd.read_excel(file_path, sheet_name=sheet_name, header=header, usecols=usecols, engine=READ_ENGINE)
             df.columns = df.columns.map(str.strip)  # Strip whitespace from column names
             return df
         except Exception as e:
             self.logger.error("Error loading file %s: %s", file_path, e)
             raise
 
+    def _shrink_df(self, df, exclude=()):
+        """Downcast integer columns and turn repetitive text columns into categoricals, in place.
+
+        Columns in `exclude` (ones that are rewritten later) and helper columns starting
+        with '_' are left untouched. Floats are not downcast so written values stay exact.
+        """
+        for col in df.columns:
+            if col in exclude or col.startswith('_'):
+                continue
+            series = df[col]
+            if pd.api.types.is_integer_dtype(series):
+                df[col] = pd.to_numeric(series, downcast='integer')
+            elif (pd.api.types.is_string_dtype(series) and not isinstance(series.dtype, pd.CategoricalDtype)
+                  and len(series) and series.nunique() / len(series) < 0.5):
+                df[col] = series.astype('category')
+        return df
+
+    def _share_categories(self, left, right):
+        """Return `left` and `right` as categoricals over the union of their values.
+
+        With identical categories on both sides, merges and groupbys on the pair work on the
+        integer codes instead of hashing the strings again.
+        """
+        dtype = pd.CategoricalDtype(pd.Index(left.dropna().unique()).union(pd.Index(right.dropna().unique())))
+        return left.astype(dtype), right.astype(dtype)
+
     def save_df_with_flag_highlight(self, df_pre_ea, output_path):
         """
         Save df_pre_ea to Excel and highlight rows based on 'Flag' column values.
@@ -47,33 +97,36 @@ class ExcelFileComparator:
         - GREY: ⬜ (grey fill)
         """
 
-        # Define fill colors for each flag
-        fill_colors = {
-            'GREEN': PatternFill(start_color='C6EFCE', end_color='C6EFCE', fill_type='solid'),  # light green
-            'RED': PatternFill(start_color='FFC7CE', end_color='FFC7CE', fill_type='solid'),    # light red
-            'PURPLE': PatternFill(start_color='D9D2E9', end_color='D9D2E9', fill_type='solid'), # light purple
-            'YELLOW': PatternFill(start_color='FFEB9C', end_color='FFEB9C', fill_type='solid'), # light yellow
-            'BLUE': PatternFill(start_color='BDD7EE', end_color='BDD7EE', fill_type='solid'),   # light blue
-            'GREY': PatternFill(start_color='D9D9D9', end_color='D9D9D9', fill_type='solid'),   # light grey
-            '': None  # No fill for empty flags
-        }
-
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "PRE_EA_Report"
+        # Stream rows straight to disk (write-only mode) instead of building the whole sheet in memory
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(title="PRE_EA_Report")
+
+        # Register each fill with the workbook once and share one style array per flag between
+        # the filled cells, so the sheet ends up with a single cell format per colour
+        flag_styles = {}
+        for flag, fill in REPORT_FILLS.items():
+            flag_styles[flag] = StyleArray()
+            flag_styles[flag].fillId = wb._fills.add(fill)
 
         # Write DataFrame headers
         ws.append(list(df_pre_ea.columns))
 
-        # Write DataFrame rows with fill based on 'Flag'
-        for idx, row in df_pre_ea.iterrows():
-            ws.append(row.tolist())
-            flag = row.get('Flag', '')
-            fill = fill_colors.get(flag, None)
-            if fill:
-                # Highlight the entire row (all columns)
-                for col_idx in range(1, len(df_pre_ea.columns) + 1):
-                    ws.cell(row=ws.max_row, column=col_idx).fill = fill
+        # Write DataFrame rows, highlighting the entire row (all columns) as it is written
+        flag_col = df_pre_ea.columns.get_loc('Flag') if 'Flag' in df_pre_ea.columns else None
+        for row in df_pre_ea.itertuples(index=False, name=None):
+            style = flag_styles.get(row[flag_col]) if flag_col is not None else None
+            if style is None:
+                ws.append(row)
+                continue
+            cells = []
+            for value in row:
+                cell = WriteOnlyCell(ws, value=value)
+                if cell._style is None:
+                    cell._style = style
+                else:  # dates already carry their own number format
+                    cell._style.fillId = style.fillId
+                cells.append(cell)
+            ws.append(cells)
 
         # Save the workbook
         wb.save(output_path)
@@ -84,21 +137,20 @@ class ExcelFileComparator:
         column1_name: str,
         df2: pd.DataFrame,
         column2_name: str
-    ) -> list:
+    ) -> pd.Index:
 
         # Input validation: Check if columns exist in their respective DataFrames
         if column1_name not in df1.columns:
             raise ValueError(f"Column '{column1_name}' not found in DataFrame 1.")
         if column2_name not in df2.columns:
             raise ValueError(f"Column '{column2_name}' not found in DataFrame 2.")
-        # Extract unique items from each column and convert to sets for efficient comparison
-        set1 = set(df1[column1_name].astype(str).str.strip().unique())
-        set2 = set(df2[column2_name].astype(str).str.strip().unique())
+        # Normalize only the distinct values of each column (callers usually pass the already
+        # normalized key columns), then intersect as Index objects on pandas' hash tables
+        items1 = pd.Index(pd.Series(df1[column1_name].unique()).astype(str).str.strip()).unique()
+        items2 = pd.Index(pd.Series(df2[column2_name].unique()).astype(str).str.strip()).unique()
 
-        # Find the intersection of the two sets
-        common_items_set = set1.intersection(set2)
-        # Convert the set of common items to a list and return
-        return list(common_items_set)
+        # Keep the result as an Index so callers can feed it straight to `isin`
+        return items1.intersection(items2)
 
     def compute_licensing_files(self, pre_ea_path, cssm_path, pid_to_skus_map):
         start_time = datetime.now()
@@ -106,49 +158,60 @@ class ExcelFileComparator:
         logger.info("Starting comparison: pre_ea=%s cssm=%s", pre_ea_path, cssm_path)
         start_time = datetime.now()
 
-        # Load CSSM data
+        # Load CSSM and PRE-EA data side by side; the two workbooks are independent
         logger.info("Loading CSSM data from %s", cssm_path)
-        df_cssm = self._load_df(cssm_path, sheet_name='License Detail', header=5)
-
-        # Load PRE-EA data
         logger.info("Loading PRE-EA data from %s", pre_ea_path)
-        df_pre_ea = self._load_df(pre_ea_path,sheet_name='PRE_EA_REPORT', header=0)
-        df_pre_ea['Flag'] = ''
-        df_pre_ea['Logging Info'] = ''
-
-        # Convert the 'Due_Date' column to datetime objects
-        df_pre_ea['Expiration Date'] = pd.to_datetime(df_pre_ea['Expiration Date'])
-        today = pd.to_datetime(datetime.today().date())
-        mask = df_pre_ea['Expiration Date'] < today
-        df_pre_ea.loc[mask, 'Flag'] = 'PURPLE'
-        df_pre_ea.loc[mask, 'Logging Info'] = "🟪 Expiration date has already expired." 
-
-        common_codes_dictionary = {}
-        df_cssm['Used'] = ''
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            cssm_future = executor.submit(self._load_df, cssm_path, sheet_name='License Detail', header=5,
+                                          usecols=CSSM_COLUMNS)
+            pre_ea_future = executor.submit(self._load_df, pre_ea_path, sheet_name='PRE_EA_REPORT', header=0)
+            df_cssm, df_pre_ea = cssm_future.result(), pre_ea_future.result()
+
+        # Normalized join keys, computed once and reused by every mask below
+        df_cssm['_sid_key'] = df_cssm['Source Identifier'].astype(str).str.strip()
+        df_cssm['_sku_key'] = df_cssm['SKU'].astype(str).str.strip()
+        self._shrink_df(df_cssm)
+
+        df_pre_ea['_alc_key'] = df_pre_ea['ALC Order Number'].astype(str).str.strip()
+        self._shrink_df(df_pre_ea, exclude=('Pre EA Migrated Pid', 'Expiration Date', 'EA Virtual Account'))
+
+        # Convert the 'Due_Date' column to datetime objects, parsing each distinct value once;
+        # unparseable dates become NaT and end up YELLOW when their quantity matches
+        df_pre_ea['Expiration Date'] = pd.to_datetime(pd.Series(
+            standardize_date_column(df_pre_ea['Expiration Date'], in_format="%m/%d/%Y"), index=df_pre_ea.index))
+        # Plain datetime64 compare on the parsed column (NaT is never expired)
+        today = np.datetime64(datetime.today().date())
+        is_expired = df_pre_ea['Expiration Date'].to_numpy() < today
+
+        df_cssm['Used'] = pd.Series('', index=df_cssm.index, dtype=USED_DTYPE)
 
         # Log common matches: df_pre_ea-> 'ALC Order Number' | df_cssm->'Source Identifier'
         try:
-            common_codes_id = self.find_common_items_in_columns(df_pre_ea, 'ALC Order Number', df_cssm, 'Source Identifier')
+            common_codes_id = self.find_common_items_in_columns(df_pre_ea, '_alc_key', df_cssm, '_sid_key')
             self.logger.info(f"Common matches: {len(common_codes_id)}")
         except ValueError as e:
             self.logger.error(f"\nError: {e}")
+        # The common ids come back as a hashed Index that serves both membership masks
         # FLAG RED for non-matching ALC Order Numbers
-        mask = df_pre_ea['ALC Order Number'].astype(str).str.strip().isin(common_codes_id)
-        df_pre_ea.loc[~mask, 'Flag'] = 'RED'
-        df_pre_ea.loc[~mask, 'Logging Info'] = "🟥 FLAG RED for non-matching ALC Order Numbers"
+        no_alc_match = ~df_pre_ea['_alc_key'].isin(common_codes_id).to_numpy()
 
-        mask = df_cssm['Source Identifier'].astype(str).str.strip().isin(common_codes_id)
+        mask = df_cssm['_sid_key'].isin(common_codes_id)
         df_cssm.loc[~mask, 'Used'] = 'YES'
 
-        # Normalize pre_ea_migrated_pid_str column to valid sku (usig dictionary)
-        if pid_to_skus_map is not None:
+        # Normalize pre_ea_migrated_pid_str column to valid sku (usig dictionary);
+        # an empty map would leave every PID as it is, so skip the pass entirely
+        if pid_to_skus_map:
             # df_pre_ea['Pre EA Migrated Pid'] = df_pre_ea['Pre EA Migrated Pid'].map(pid_to_skus_map).fillna(df_pre_ea['Pre EA Migrated Pid'])
             # Store the original 'Pre EA Migrated Pid' column before any modifications
             original_pids = df_pre_ea['Pre EA Migrated Pid'].copy()
 
+            # Map each distinct PID once; rows are filled back from their factorized codes
+            codes, unique_pids = pd.factorize(original_pids)
+            unique_pids = pd.Series(unique_pids)
+
             # Apply the mapping from pid_to_skus_map
             # Values not found in the map will become NaN
-            df_pre_ea['Pre EA Migrated Pid'] = df_pre_ea['Pre EA Migrated Pid'].map(pid_to_skus_map)
+            mapped_pids = unique_pids.map(pid_to_skus_map)
 
             # Define a function to process the mapped values:
             # 1. If it's a list containing a single element, extract that element.
@@ -164,161 +227,152 @@ class ExcelFileComparator:
                         return pd.NA
                 return value
 
-            # Apply the processing function to the mapped column
-            df_pre_ea['Pre EA Migrated Pid'] = df_pre_ea['Pre EA Migrated Pid'].apply(process_mapped_pid)
+            # Apply the processing function to the mapped values
+            mapped_pids = mapped_pids.apply(process_mapped_pid)
 
             # Fill any remaining NaN values (from original map or from [''] conversion)
-            # with the corresponding original PID from the 'original_pids' series.
-            df_pre_ea['Pre EA Migrated Pid'] = df_pre_ea['Pre EA Migrated Pid'].fillna(original_pids)
+            # with the original PID, then spread the results back over the rows
+            mapped_pids = mapped_pids.fillna(unique_pids).to_numpy(dtype=object)
+            df_pre_ea['Pre EA Migrated Pid'] = pd.Series(
+                mapped_pids[codes] if len(mapped_pids) else original_pids.to_numpy(dtype=object),
+                index=df_pre_ea.index,
+            ).where(codes >= 0, original_pids)
+        df_pre_ea['_pid_key'] = df_pre_ea['Pre EA Migrated Pid'].astype(str).str.strip()
         # FLAG RED for non-matching No SKU (or mapped exception)
         try:
-            common_skus = self.find_common_items_in_columns(df_pre_ea, 'Pre EA Migrated Pid', df_cssm, 'SKU')
+            common_skus = self.find_common_items_in_columns(df_pre_ea, '_pid_key', df_cssm, '_sku_key')
             self.logger.info(f"Common SKU matches: {len(common_skus)}")
-            mask = df_pre_ea['Pre EA Migrated Pid'].astype(str).str.strip().isin(common_skus)
-            df_pre_ea.loc[~mask, 'Flag'] = 'RED'
-            df_pre_ea.loc[~mask, 'Logging Info'] = "🟥 FLAG RED for non-matching SKU (or mapped exception)"
+            no_sku_match = ~df_pre_ea['_pid_key'].isin(common_skus).to_numpy()
         except ValueError as e:
             self.logger.error(f"\nError: {e}")
-        
-        dictionary_filter = {}
-
-        for source_identifier in common_codes_id:
-            mask_pre_ea = df_pre_ea['ALC Order Number'].astype(str).str.strip() == str(source_identifier).strip()
-            mask_flag = df_pre_ea['Flag'] == ''
-            combined_mask_1 = mask_pre_ea & mask_flag
-            unique_skus = df_pre_ea[combined_mask_1]['Pre EA Migrated Pid'].astype(str).str.strip().unique()
-
-            # Ensure the dictionary entry is a list before appending
-            if source_identifier not in dictionary_filter:
-                dictionary_filter[source_identifier] = []
-            for sku in unique_skus:
-                dictionary_filter[source_identifier].append(sku) # Just call append(), no assignment
-
-        common_codes_dictionary = {}
-        for source_id, sku_list in dictionary_filter.items():
-            # print(f"Source Identifier: {source_id}")
-            if source_id not in common_codes_dictionary:
-                common_codes_dictionary[source_id] = {}
-            for sku in sku_list:
-                # print(f"    Individual SKU: {sku}")
-                mask_sku = df_pre_ea['Pre EA Migrated Pid'].astype(str).str.strip() == str(sku).strip()
-                mask_flag = df_pre_ea['Flag'] == ''
-                mask_pre_ea = df_pre_ea['ALC Order Number'].astype(str).str.strip() == str(source_id).strip()
-                combined_mask = mask_pre_ea & mask_sku & mask_flag
-
-                mask_sku_cssm = df_cssm['SKU'].astype(str).str.strip() == sku
-                mask_source_id_cssm = df_cssm['Source Identifier'].astype(str).str.strip() == str(source_id).strip()
-                combined_mask_cssm = mask_sku_cssm & mask_source_id_cssm
-                common_codes_dictionary[source_id][sku] = (df_pre_ea[combined_mask], df_cssm[combined_mask_cssm])
-                # print(len(df_pre_ea[combined_mask]),len(df_cssm[combined_mask_cssm]))
-        
-        for source_id, sku_dict in common_codes_dictionary.items():
-            for sku, (df_pre_ea_subset, df_cssm_subset) in sku_dict.items():
-                for pre_ea_index, pre_ea_row in df_pre_ea_subset.iterrows():
-                    pre_ea_quantity = pre_ea_row['Quantity']
-                    pre_ea_exp_date_str = pre_ea_row['Expiration Date']
-                    pre_ea_exp_date = standardize_date(pre_ea_exp_date_str)
-                    matched = False
-
-                    for cssm_index, cssm_row in df_cssm_subset.iterrows():
-                        cssm_available = cssm_row['Available To Use']
-                        cssm_virtual_account = cssm_row['Virtual Account']
-                        if cssm_available == pre_ea_quantity and not common_codes_dictionary[source_id][sku][1].loc[cssm_index, 'Used'] == 'Yes':
-                            if pre_ea_exp_date:
-                                # Valid expiration date: set green flag
-                                print(f"Green: source_id={source_id}, sku={sku}, Quantity={pre_ea_quantity}, Available To Use={cssm_available}, Expiration Date={pre_ea_exp_date_str}")
-                                # Example of setting flags in df_pre_ea:
-                                # df_to_update = common_codes_dictionary[source_id][sku][1]
-                                common_codes_dictionary[source_id][sku][1].loc[cssm_index, 'Used'] = 'Yes'
-                                df_pre_ea.at[pre_ea_index, 'Flag'] = 'GREEN'
-                                df_pre_ea.at[pre_ea_index, 'Logging Info'] = "🟩 FLAG GREEN: Quantity and valid Expiration Date match found."
-                                df_pre_ea.at[pre_ea_index, 'EA Virtual Account'] = cssm_virtual_account
-                            else:
-                                # Invalid or empty expiration date: set yellow flag
-                                print(f"Yellow: source_id={source_id}, sku={sku}, Quantity={pre_ea_quantity}, Available To Use={cssm_available}, Expiration Date invalid or empty")
-                                df_pre_ea.at[pre_ea_index, 'Flag'] = 'YELLOW'
-                                df_pre_ea.at[pre_ea_index, 'Logging Info'] = "🟨 FLAG YELLOW: Quantity match found but Expiration Date invalid or empty."
-                                df_pre_ea.at[pre_ea_index, 'EA Virtual Account'] = cssm_virtual_account
-                            matched = True
-                            break  # Stop checking CSSM rows once a match is found
-
-                    if not matched:
-                        # No matching Available To Use found for this Pre-EA quantity
-                        print(f"Blue: source_id={source_id}, sku={sku}, Quantity={pre_ea_quantity} (no matching Available To Use found)")
-                        df_pre_ea.at[pre_ea_index, 'Flag'] = 'BLUE'
-                        df_pre_ea.at[pre_ea_index, 'Logging Info'] = "🔵 FLAG BLUE: No matching Available To Use found."
-
-        # Loop over common_codes_dictionary again to process BLUE flags
-        for source_id, sku_dict in common_codes_dictionary.items():
-            for sku, (df_pre_ea_subset, df_cssm_subset) in sku_dict.items():
-                # Filter BLUE flagged rows in df_pre_ea_subset
-                mask_source = (df_pre_ea['ALC Order Number'].astype(str).str.strip() == str(source_id).strip())
-                mask_sku = (df_pre_ea['Pre EA Migrated Pid'].astype(str).str.strip() == str(sku).strip())
-                mask_flag_blue = (df_pre_ea['Flag'] == 'BLUE')
-                blue_rows = df_pre_ea[mask_source & mask_sku & mask_flag_blue]
-                if blue_rows.empty:
-                    continue  # No BLUE rows to process for this sku and source_id
-                # Sum the Quantity of BLUE rows
-                total_blue_quantity = blue_rows['Quantity'].sum()
-
-                # Sum the Quantity in CSSM subset for this sku and source_id
-                # total_cssm_quantity = df_cssm_subset['Available To Use'].sum()  # or 'Quantity' if that column exists; adjust accordingly
-
-                cssm_filter_not_used_yes = (df_cssm_subset['Used'] != 'Yes')
-
-                # Apply the filter and then sum 'Available To Use'
-                total_cssm_quantity = df_cssm_subset[cssm_filter_not_used_yes]['Available To Use'].sum()
-                if sku == 'C9400-DNA-A' and source_id == '112165002':
-                    print(sku, source_id, total_cssm_quantity, total_blue_quantity)
-                    print(df_cssm_subset[['Available To Use','Used']])
-                    
-
-
-                try:
-                    cssm_virtual_account = df_cssm_subset['Virtual Account'].iloc[0]
-                except:
-                    print("failed")
-
-                if total_blue_quantity == total_cssm_quantity:
-                    # Update all BLUE rows to GREY in prea 
-                    for pre_ea_index in blue_rows.index:
-                        df_pre_ea.at[pre_ea_index, 'Flag'] = 'GREEN'
-                        df_pre_ea.at[pre_ea_index, 'Logging Info'] = f"🟩FLAG GREEN: Total BLUE Quantity EQUAL CSSM Quantity EQ.{total_blue_quantity} cssm:{total_cssm_quantity}"
-                        df_pre_ea.at[pre_ea_index, 'EA Virtual Account'] = cssm_virtual_account
-                elif total_blue_quantity < total_cssm_quantity:
-                    # print(total_blue_quantity,total_cssm_quantity,df_pre_ea['Pre EA Migrated Pid'] )
-                    for pre_ea_index in blue_rows.index:
-                        df_pre_ea.at[pre_ea_index, 'Flag'] = 'GREY'
-                        df_pre_ea.at[pre_ea_index, 'Logging Info'] = f"⬜ FLAG GREY: Total BLUE Quantity less than CSSM Quantity.{total_blue_quantity} cssm:{total_cssm_quantity}"
-                        df_pre_ea.at[pre_ea_index, 'EA Virtual Account'] = cssm_virtual_account
-                
+            no_sku_match = np.zeros(len(df_pre_ea), dtype=bool)
+
+        # Assign the pre-match flags in one pass, first condition wins: an expired row stays
+        # PURPLE and an unknown ALC Order Number is reported before an unknown SKU
+        conditions = [is_expired, no_alc_match, no_sku_match]
+        df_pre_ea['Flag'] = pd.Categorical(np.select(conditions, ['PURPLE', 'RED', 'RED'], default=''),
+                                           dtype=FLAG_DTYPE)
+        df_pre_ea['Logging Info'] = np.select(conditions, [
+            "🟪 Expiration date has already expired.",
+            "🟥 FLAG RED for non-matching ALC Order Numbers",
+            "🟥 FLAG RED for non-matching SKU (or mapped exception)",
+        ], default='')
+
+        # From here on the join keys are only matched against each other, so encode each pair once
+        df_pre_ea['_alc_key'], df_cssm['_sid_key'] = self._share_categories(df_pre_ea['_alc_key'], df_cssm['_sid_key'])
+        df_pre_ea['_pid_key'], df_cssm['_sku_key'] = self._share_categories(df_pre_ea['_pid_key'], df_cssm['_sku_key'])
+
+        # Still-unflagged PRE-EA rows go on to quantity matching
+        df_pre_ea_unflagged = df_pre_ea[df_pre_ea['Flag'] == '']
+
+        # Quantity matching per (source id, SKU): each PRE-EA row takes the first CSSM row of its
+        # group with an equal quantity that no earlier GREEN row consumed (YELLOW rows match but
+        # do not consume), so a row pairs with the CSSM row whose rank among equal quantities is
+        # the number of earlier valid-date rows with that quantity (missing quantities never match)
+        key_cols = ['_alc_key', '_pid_key']
+        pre_ea_match = df_pre_ea_unflagged.loc[df_pre_ea_unflagged[key_cols].notna().all(axis=1), key_cols]
+        pre_ea_match = pre_ea_match.assign(
+            _qty=pd.to_numeric(df_pre_ea_unflagged['Quantity'], errors='coerce').astype(float),
+            _valid=df_pre_ea_unflagged['Expiration Date'].notna().astype(int),
+            _row=pre_ea_match.index,
+        )
+        consumed = pre_ea_match.groupby(key_cols + ['_qty'], sort=False, dropna=False)['_valid'].cumsum()
+        pre_ea_match['_rank'] = consumed - pre_ea_match['_valid']
+        cssm_match = df_cssm[['_sid_key', '_sku_key']].assign(
+            _qty=pd.to_numeric(df_cssm['Available To Use'], errors='coerce').astype(float),
+            _cssm_pos=np.arange(len(df_cssm)),
+        ).dropna()
+        cssm_match['_rank'] = cssm_match.groupby(['_sid_key', '_sku_key', '_qty'], sort=False).cumcount()
+        matches = pre_ea_match.merge(cssm_match, how='left',
+                                     left_on=key_cols + ['_qty', '_rank'],
+                                     right_on=['_sid_key', '_sku_key', '_qty', '_rank'],
+                                     validate='many_to_one', indicator=True)
+
+        matched = (matches['_merge'] == 'both').to_numpy()
+        matched_rows = matches['_row'].to_numpy()[matched]
+        matched_cssm_pos = matches['_cssm_pos'].to_numpy()[matched].astype(np.intp)
+        valid_exp = matches['_valid'].to_numpy()[matched].astype(bool)
+        # Only GREEN matches use up their CSSM row
+        df_cssm.iloc[matched_cssm_pos[valid_exp], df_cssm.columns.get_loc('Used')] = 'Yes'
+        df_pre_ea.loc[matched_rows, 'EA Virtual Account'] = df_cssm['Virtual Account'].to_numpy()[matched_cssm_pos]
+        # Valid expiration date: set green flag
+        green_rows = matched_rows[valid_exp]
+        df_pre_ea.loc[green_rows, 'Flag'] = 'GREEN'
+        df_pre_ea.loc[green_rows, 'Logging Info'] = "🟩 FLAG GREEN: Quantity and valid Expiration Date match found."
+        # Invalid or empty expiration date: set yellow flag
+        yellow_rows = matched_rows[~valid_exp]
+        df_pre_ea.loc[yellow_rows, 'Flag'] = 'YELLOW'
+        df_pre_ea.loc[yellow_rows, 'Logging Info'] = "🟨 FLAG YELLOW: Quantity match found but Expiration Date invalid or empty."
+        # No matching Available To Use found for this Pre-EA quantity
+        blue_rows = matches['_row'].to_numpy()[~matched]
+        df_pre_ea.loc[blue_rows, 'Flag'] = 'BLUE'
+        df_pre_ea.loc[blue_rows, 'Logging Info'] = "🔵 FLAG BLUE: No matching Available To Use found."
+
+        # Reconcile the BLUE rows per (source id, SKU): compare each group's total BLUE Quantity with
+        # the 'Available To Use' left on the group's CSSM rows not used by a GREEN match
+        df_pre_ea_blue = df_pre_ea[df_pre_ea['Flag'] == 'BLUE']
+        blue_grouped = df_pre_ea_blue.groupby(['_alc_key', '_pid_key'], sort=False, observed=True)
+        group_ids = blue_grouped.ngroup().to_numpy()
+        blue_totals = blue_grouped['Quantity'].sum()
+        groups = blue_totals.index.rename(['_sid_key', '_sku_key'])  # same keys, CSSM-side names
+
+        cssm_keys = ['_sid_key', '_sku_key']
+        cssm_totals = (df_cssm[df_cssm['Used'] != 'Yes']
+                       .groupby(cssm_keys, observed=True)['Available To Use'].sum()
+                       .reindex(groups, fill_value=0))
+        # Reconciled rows take the virtual account of the first CSSM row of their group
+        cssm_accounts = (df_cssm.drop_duplicates(cssm_keys).set_index(cssm_keys)['Virtual Account']
+                         .reindex(groups))
+
+        blue_totals, cssm_totals = blue_totals.to_numpy(), cssm_totals.to_numpy()
+        cssm_accounts = cssm_accounts.to_numpy(dtype=object)
+        outcomes = (
+            # Equal totals turn the whole group GREEN, a smaller BLUE total turns it GREY
+            ('GREEN', blue_totals == cssm_totals,
+             "🟩FLAG GREEN: Total BLUE Quantity EQUAL CSSM Quantity EQ.{} cssm:{}"),
+            ('GREY', blue_totals < cssm_totals,
+             "⬜ FLAG GREY: Total BLUE Quantity less than CSSM Quantity.{} cssm:{}"),
+        )
+        for flag, group_mask, template in outcomes:
+            messages = np.full(len(group_mask), None, dtype=object)
+            for group in np.flatnonzero(group_mask):
+                messages[group] = template.format(blue_totals[group], cssm_totals[group])
+            row_mask = group_mask[group_ids]
+            rows = df_pre_ea_blue.index[row_mask]
+            df_pre_ea.loc[rows, 'Flag'] = flag
+            df_pre_ea.loc[rows, 'Logging Info'] = messages[group_ids[row_mask]]
+            df_pre_ea.loc[rows, 'EA Virtual Account'] = cssm_accounts[group_ids[row_mask]]
+
         # check point
 
     # counte green flags    
-        green_count = df_pre_ea['Flag'].value_counts().get('GREEN', 0)
+        flag_counts = df_pre_ea['Flag'].value_counts()
+        green_count = flag_counts.get('GREEN', 0)
         print(f"🟩 Number of GREEN rows: {green_count}")
-        red_count = df_pre_ea['Flag'].value_counts().get('RED', 0)
+        red_count = flag_counts.get('RED', 0)
         print(f"🟥 Number of RED rows: {red_count}")
-        purple_count = df_pre_ea['Flag'].value_counts().get('PURPLE', 0)
+        purple_count = flag_counts.get('PURPLE', 0)
         print(f"🟪 Number of PURPLE rows: {purple_count}")
-        yellow_count = df_pre_ea['Flag'].value_counts().get('YELLOW', 0)
+        yellow_count = flag_counts.get('YELLOW', 0)
         print(f"🟨 Number of YELLOW rows: {yellow_count}")
-        blue_count = df_pre_ea['Flag'].value_counts().get('BLUE', 0)
+        blue_count = flag_counts.get('BLUE', 0)
         print(f"🔵 Number of BLUE rows: {blue_count}")
-        gray_count = df_pre_ea['Flag'].value_counts().get('GREY', 0)
+        gray_count = flag_counts.get('GREY', 0)
         print(f"⬜ Number of GREY rows: {gray_count}")
 
-        print(len(df_pre_ea))
+        logger.debug("PRE-EA rows processed: %d", len(df_pre_ea))
         # Prepare output workbook
         output_dir = self.output_dir
         base_name = os.path.basename(pre_ea_path)
         out_name = base_name.replace('.xlsx', '_compared.xlsx')
         out_path = os.path.join(output_dir, out_name)
 
-        # Save df_pre_ea to the desired output Excel file
-        df_pre_ea.to_excel(out_path, index=False)
+        # Drop the helper key columns before writing
+        df_pre_ea = df_pre_ea.drop(columns=['_alc_key', '_pid_key'])
 
+        # Save df_pre_ea to the desired output Excel file (values and row highlights in one write)
         self.save_df_with_flag_highlight(df_pre_ea, out_path)
+        flush_logging()  # the Streamlit app reads the log file right after this returns
         return out_path, green_count, red_count, purple_count, yellow_count, blue_count, gray_count, (datetime.now() - start_time).total_seconds()
 
 
@@ -0,0 +1,23 @@
+from datetime import date
+
+import pandas as pd
+
+from utils.date_utils import standardize_date_column
+
+
+def test_datetime64_column_with_nat():
+    column = pd.Series(pd.to_datetime(["2026-01-31", None, "2027-12-01"]))
+    assert column.dtype.kind == "M"
+
+    dates = standardize_date_column(column)
+
+    assert dates.tolist() == [date(2026, 1, 31), None, date(2027, 12, 1)]
+    assert dates.dtype == object
+
+
+def test_string_column_matches_scalar_parsing():
+    dates = standardize_date_column(["01/31/2026", "", None, "2027-Feb-23 00:00:00"], in_format="%m/%d/%Y")
+
+    assert dates[0] == date(2026, 1, 31)
+    assert dates[2] is None
+    assert dates[3] == date(2027, 2, 23)
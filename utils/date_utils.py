@@ -1,7 +1,41 @@
 from datetime import datetime
+import numpy as np
 import pandas as pd
 import re
 
+# Explicit strptime patterns tried, in order, before falling back to the pandas parser
+_CANDIDATE_FORMATS = (
+    # ISO-like and dashes
+    "%Y-%m-%d",
+    "%d-%m-%Y",
+    # Slashes (EU and US) with 4-digit year
+    "%d/%m/%Y",
+    "%m/%d/%Y",
+    "%m/%d/%Y %H:%M:%S",
+    # Slashes with 2-digit year
+    "%d/%m/%y",
+    "%m/%d/%y",
+    "%m/%d/%y %H:%M:%S",
+    # Year-first with slashes
+    "%Y/%m/%d",
+    # Month name variants
+    "%Y-%b-%d %H:%M:%S",  # e.g., 2025-Feb-23 00:00:00
+    "%Y-%b-%d",
+    "%d-%b-%Y",
+    "%d-%b-%Y %H:%M:%S",
+    "%Y-%B-%d %H:%M:%S",
+    "%Y-%B-%d",
+    "%d-%B-%Y",
+    "%d-%B-%Y %H:%M:%S",
+)
+
+# Patterns used by `has_year_component`
+_YEAR_4 = re.compile(r"\b\d{4}\b")
+_SHORT_YEAR = re.compile(r"^\s*\d{1,2}[/-]\d{1,2}[/-]\d{2}\s*$")
+_MONTH_NAME_YEAR = re.compile(
+    r"(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Sept|Oct|Nov|Dec)[a-z]*.*\b(\d{4}|\d{2})\b", re.IGNORECASE
+)
+
 
 def standardize_date(
     date_input,
@@ -47,31 +81,7 @@ def standardize_date(
                 continue
 
     # Try explicit strptime patterns first (fast path)
-    candidate_formats = (
-        # ISO-like and dashes
-        "%Y-%m-%d",
-        "%d-%m-%Y",
-        # Slashes (EU and US) with 4-digit year
-        "%d/%m/%Y",
-        "%m/%d/%Y",
-        "%m/%d/%Y %H:%M:%S",
-        # Slashes with 2-digit year
-        "%d/%m/%y",
-        "%m/%d/%y",
-        "%m/%d/%y %H:%M:%S",
-        # Year-first with slashes
-        "%Y/%m/%d",
-        # Month name variants
-        "%Y-%b-%d %H:%M:%S",  # e.g., 2025-Feb-23 00:00:00
-        "%Y-%b-%d",
-        "%d-%b-%Y",
-        "%d-%b-%Y %H:%M:%S",
-        "%Y-%B-%d %H:%M:%S",
-        "%Y-%B-%d",
-        "%d-%B-%Y",
-        "%d-%B-%Y %H:%M:%S",
-    )
-    for fmt in candidate_formats:
+    for fmt in _CANDIDATE_FORMATS:
         try:
             date_obj = datetime.strptime(text, fmt).date()
             return date_obj.strftime(out_format) if out_format else date_obj
@@ -86,6 +96,52 @@ def standardize_date(
         return None
 
 
+def standardize_date_column(values, in_format: str | list[str] | None = None) -> np.ndarray:
+    """Parse a whole column with `standardize_date`, calling it once per distinct value.
+
+    - Columns already loaded as datetime64 are converted in one vectorized step.
+    - Returns an object array of `datetime.date` (or None when parsing fails) aligned with `values`.
+    """
+    series = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(series):
+        # Copy: with Copy-on-Write the converted array is a read-only view
+        dates = series.dt.date.to_numpy(dtype=object).copy()
+        dates[series.isna().to_numpy()] = None
+        return dates
+
+    codes, uniques = pd.factorize(series.astype(object))
+    parsed = _parse_distinct_dates(pd.Series(uniques, dtype=object), in_format)
+    # factorize marks missing values with code -1, which picks the trailing None
+    return np.array(parsed + [None], dtype=object)[codes]
+
+
+def _parse_distinct_dates(values: pd.Series, in_format: str | list[str] | None) -> list:
+    """Parse `values` the way `standardize_date` would, one format at a time across all strings.
+
+    Each candidate format is tried on whatever is still unparsed with a single `pd.to_datetime`
+    call; only values no explicit format understands (and non-strings) go through the scalar path.
+    """
+    dates = np.full(len(values), None, dtype=object)
+    unparsed = np.ones(len(values), dtype=bool)
+    is_text = values.map(type).eq(str)
+    text = values[is_text].str.strip()
+
+    formats = [in_format] if isinstance(in_format, str) else list(in_format or [])
+    for fmt in formats + list(_CANDIDATE_FORMATS):
+        if text.empty:
+            break
+        attempt = pd.to_datetime(text, format=fmt, errors="coerce")
+        matched = attempt.notna()
+        positions = text.index[matched]
+        dates[positions] = attempt[matched].dt.date.to_numpy(dtype=object)
+        unparsed[positions] = False
+        text = text[~matched]
+
+    for pos in np.flatnonzero(unparsed):
+        dates[pos] = standardize_date(values.iat[pos], in_format=in_format)
+    return dates.tolist()
+
+
 def format_date_mmddyyyy(date_input, in_format: str | list[str] | None = None) -> str | None:
     """Return the date formatted as MM/DD/YYYY, or None if parsing fails.
 
@@ -111,14 +167,13 @@ def has_year_component(value) -> bool:
         return False
 
     # 4-digit year anywhere
-    if re.search(r"\b\d{4}\b", text):
+    if _YEAR_4.search(text):
         return True
     # dd/mm/yy or mm/dd/yy
-    if re.match(r"^\s*\d{1,2}[/-]\d{1,2}[/-]\d{2}\s*$", text):
+    if _SHORT_YEAR.match(text):
         return True
     # Month name followed by 4 or 2 digit year somewhere
-    month_name = r"(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Sept|Oct|Nov|Dec)[a-z]*"
-    if re.search(month_name + r".*\b(\d{4}|\d{2})\b", text, re.IGNORECASE):
+    if _MONTH_NAME_YEAR.search(text):
         return True
 
     return False
@@ -0,0 +1,33 @@
+from openpyxl.styles.cell_style import StyleArray
+
+try:
+    import python_calamine  # noqa: F401
+    READ_ENGINE = 'calamine'
+except ImportError:
+    # pandas' openpyxl reader already opens the workbook read-only and values-only
+    READ_ENGINE = 'openpyxl'
+
+# CSSM 'License Detail' columns the comparators actually read
+CSSM_COMPARE_COLUMNS = ('Source Identifier', 'SKU', 'Available To Use', 'Subscription End Date')
+
+
+def paint_rows(ws, row_indices, ncols: int, fill) -> None:
+    """Apply `fill` to the first `ncols` cells of every worksheet row in `row_indices`.
+
+    Fetches each row's cells in one pass instead of calling `ws.cell()` per column, and
+    registers the fill with the workbook once for the whole batch so each cell only gets
+    its fill id (what `cell.fill = fill` does after a per-cell lookup).
+    """
+    fill_id = ws.parent._fills.add(fill)
+    for row_idx in row_indices:
+        for row_cells in ws.iter_rows(min_row=row_idx, max_row=row_idx, max_col=ncols):
+            for cell in row_cells:
+                if cell._style is None:  # cells created in this session have no style array yet
+                    cell._style = StyleArray()
+                cell._style.fillId = fill_id
+
+
+def stripped_usecols(names):
+    """Return a `pd.read_excel(usecols=...)` callable that matches header names after stripping whitespace."""
+    wanted = set(names)
+    return lambda column: str(column).strip() in wanted
@@ -1,30 +1,41 @@
 import os
 import shutil
 import logging
+from concurrent.futures import ThreadPoolExecutor
+
+# Deleting entries is syscall-bound, so a few threads overlap the waits on slow filesystems
+_DELETE_WORKERS = 8
+
+
+def _delete_entry(entry: os.DirEntry) -> None:
+    path = entry.path
+    try:
+        if entry.is_file() or entry.is_symlink():
+            os.unlink(path)
+        elif entry.is_dir():
+            shutil.rmtree(path)
+    except Exception as exc:
+        logging.getLogger(__name__).warning("Failed to delete %s: %s", path, exc)
 
 
 def ensure_clean_dir(directory_path: str) -> None:
     """Ensure directory exists and is empty.
 
     - Creates the directory if missing.
-    - Removes all files, symlinks, and subdirectories if it exists.
+    - Removes all files, symlinks, and subdirectories if it exists, several at a time.
     - Logs warnings for entries that cannot be deleted and re-raises unexpected errors.
     """
     os.makedirs(directory_path, exist_ok=True)
-    logger = logging.getLogger(__name__)
     try:
+        # List everything first so deleting never races the directory iterator
         with os.scandir(directory_path) as it:
-            for entry in it:
-                path = entry.path
-                try:
-                    if entry.is_file() or entry.is_symlink():
-                        os.unlink(path)
-                    elif entry.is_dir():
-                        shutil.rmtree(path)
-                except Exception as exc:
-                    logger.warning("Failed to delete %s: %s", path, exc)
+            entries = list(it)
+        if len(entries) <= 1:
+            for entry in entries:
+                _delete_entry(entry)
+            return
+        with ThreadPoolExecutor(max_workers=min(_DELETE_WORKERS, len(entries))) as executor:
+            list(executor.map(_delete_entry, entries))
     except Exception:
         # Let caller decide how to handle overall failure
         raise
-
-
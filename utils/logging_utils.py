@@ -1,8 +1,28 @@
 import os
+import atexit
+import queue
 import logging
+from logging.handlers import QueueHandler, QueueListener
+
+# Background listener that writes queued records to the log file
+_queue_listener: QueueListener | None = None
+
+
+def _stop_queue_listener():
+    global _queue_listener
+    if _queue_listener is None:
+        return
+    _queue_listener.stop()  # drains pending records before returning
+    for handler in _queue_listener.handlers:
+        handler.close()
+    _queue_listener = None
+
+
+atexit.register(_stop_queue_listener)
 
 
 def setup_logging(log_dir: str | None = None, log_filename: str = "compare_excels.log"):
+    global _queue_listener
     # Configure root logger to write everything to a file only
     root_logger = logging.getLogger()
     root_logger.setLevel(logging.DEBUG)
@@ -10,15 +30,31 @@ def setup_logging(log_dir: str | None = None, log_filename: str = "compare_excel
     # Remove any existing handlers to avoid duplicates/console output
     for handler in list(root_logger.handlers):
         root_logger.removeHandler(handler)
+    _stop_queue_listener()
 
     formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s - %(message)s")
     logfile_path = os.path.join(log_dir or os.getcwd(), log_filename)
-    file_handler = logging.FileHandler(logfile_path, mode='w', encoding='utf-8')
+    file_handler = logging.FileHandler(logfile_path, mode='w', encoding='utf-8', delay=True)
     file_handler.setFormatter(formatter)
     file_handler.setLevel(logging.DEBUG)
-    root_logger.addHandler(file_handler)
+
+    # Callers only enqueue records; file I/O happens on the listener thread
+    log_queue = queue.Queue(-1)
+    _queue_listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _queue_listener.start()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setLevel(logging.DEBUG)
+    root_logger.addHandler(queue_handler)
 
     root_logger.debug(f"Logging to file: {logfile_path}")
     return root_logger
 
 
+def flush_logging() -> None:
+    """Block until every queued record has been written to the log file.
+
+    The file handler flushes after each record it emits, so draining the queue is enough.
+    """
+    if _queue_listener is None:
+        return
+    _queue_listener.queue.join()
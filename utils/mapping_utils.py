@@ -2,6 +2,11 @@ import os
 import json
 import logging
 
+try:
+    import orjson  # optional, faster parser for large mapping files
+except ImportError:
+    orjson = None
+
 
 def load_pid_to_skus_map(mapping_path: str | None) -> dict[str, list[str]]:
     """Load PID→SKUs mapping from an external JSON file.
@@ -22,16 +27,21 @@ def load_pid_to_skus_map(mapping_path: str | None) -> dict[str, list[str]]:
             return {}
 
     try:
-        with open(mapping_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        if orjson is not None:
+            with open(mapping_path, "rb") as f:
+                data = orjson.loads(f.read())
+        else:
+            with open(mapping_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
         if not isinstance(data, dict):
             raise ValueError("Mapping JSON must be an object mapping strings to list[str]")
         normalized: dict[str, list[str]] = {}
         for key, value in data.items():
+            # JSON object keys are always strings already
             if isinstance(value, list):
-                normalized[str(key).strip()] = [str(v).strip() for v in value]
+                normalized[key.strip()] = [str(v).strip() for v in value]
             elif isinstance(value, str):
-                normalized[str(key).strip()] = [value.strip()]
+                normalized[key.strip()] = [value.strip()]
             else:
                 logger.warning("Ignoring invalid mapping value for key '%s': %r", key, value)
         logger.info("Loaded %d PID→SKU exception entries from %s", len(normalized), mapping_path)